@@ -1,11 +1,16 @@
+import uuid
+
 import streamlit as st
-import random
 import pandas as pd
 import plotly.graph_objects as go
-import plotly.express as px
 from plotly.subplots import make_subplots
 import numpy as np
 
+try:
+    from numba import njit, prange
+except ImportError:  # numba is optional; NumPy fallback below
+    njit = None
+
 # Page configuration
 st.set_page_config(
     page_title="🔋 Battery Cell Monitor",
@@ -15,7 +20,7 @@ st.set_page_config(
 )
 
 # Custom CSS for styling
-st.markdown("""
+CSS_BLOCK = """
 <style>
     .main-header {
         text-align: center;
@@ -55,8 +60,211 @@ st.markdown("""
     .stProgress .st-bo {
         background-color: #667eea;
     }
+
+    .preview-row {
+        display: flex;
+        flex-wrap: wrap;
+        gap: 0.5rem;
+    }
+
+    .preview-row .cell-card {
+        flex: 1 1 200px;
+    }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+# Emitted every run: Streamlit removes elements a run doesn't re-emit,
+# so a once-per-session guard would drop all styling on the first rerun
+st.markdown(CSS_BLOCK, unsafe_allow_html=True)
+
+DF_COLUMNS = ['Cell', 'Voltage (V)', 'Current (A)', 'Temperature (°C)',
+              'Capacity (Ah)', 'Level %', 'Type']
+
+MAX_CELLS = 8
+
+# Typed record layout for one cell; type is 0 for LFP, 1 for NMC.
+# The full 8-cell table is 8 x 28 bytes of contiguous memory.
+CELL_DTYPE = np.dtype([
+    ('voltage', 'f4'),
+    ('current', 'f4'),
+    ('temp', 'f4'),
+    ('capacity', 'f4'),
+    ('min_v', 'f4'),
+    ('max_v', 'f4'),
+    ('type', 'u1')
+])
+
+
+
+if njit is not None:
+    @njit(parallel=True, cache=True)
+    def _summarize(temp, capacity):
+        n = len(temp)
+        tot_cap = 0.0
+        tot_temp = 0.0
+        levels = np.empty(n)
+        for i in prange(n):
+            levels[i] = min(100.0, capacity[i] * 10)
+            tot_cap += capacity[i]
+            tot_temp += temp[i]
+        return tot_cap, tot_temp / n, levels
+
+
+def summarize(temp: np.ndarray, capacity: np.ndarray):
+    """Fused aggregation over the cell arrays.
+
+    Returns (total capacity, mean temperature, battery levels). With
+    numba available this is a single parallel JIT-compiled pass, so the
+    aggregates stay cheap if MAX_CELLS is ever raised; otherwise it
+    falls back to plain NumPy reductions.
+    """
+    if njit is None:
+        levels = np.clip(capacity * 10.0, 0.0, 100.0)
+        return float(capacity.sum()), float(temp.mean()), levels
+    return _summarize(temp, capacity)
+
+
+def update_capacity(cell_key: str, idx: int):
+    """on_change callback for a cell's current input.
+
+    Runs only when that specific input actually changes, instead of the
+    old compare-and-write pass over every cell on every rerun.
+    """
+    cell = st.session_state.cells_data[cell_key]
+    new_current = st.session_state[f"current_{cell_key}"]
+    capacity = round(cell['voltage'] * new_current, 2)
+    cell['current'] = new_current
+    cell['capacity'] = capacity
+    st.session_state.cells['current'][idx] = new_current
+    st.session_state.cells['capacity'][idx] = capacity
+    st.session_state.df.loc[idx, 'Current (A)'] = new_current
+    st.session_state.df.loc[idx, 'Capacity (Ah)'] = capacity
+    st.session_state.df.loc[idx, 'Level %'] = min(100.0, capacity * 10)
+    st.session_state.cells_rev += 1
+
+
+@st.cache_resource(max_entries=4)
+def make_dashboard_figure(session_token: str, rev: int) -> go.Figure:
+    """All three Step-2 charts as one subplot figure, cached per data state.
+
+    Figures are mutable objects, so cache_resource (not cache_data) is
+    the right tier: the same Figure instance is reused across reruns
+    whenever the cell data matches. A single figure also means one
+    plotly.js instance in the browser instead of three.
+
+    Keyed on the monotonic cells_rev counter, which every cell mutation
+    increments: hashing one int is O(1), unlike snapshotting the
+    DataFrame into a tuple on each rerun. cache_resource is shared
+    across sessions while rev is per-session, so the key also carries a
+    per-session token to keep one session's figures from leaking into
+    another; max_entries keeps the ever-growing rev from accumulating
+    figures forever.
+    """
+    # Schema is fully known, so build traces straight from NumPy arrays
+    # and skip Plotly Express's DataFrame copy and column inference
+    df = st.session_state.df
+    names = df['Cell'].to_numpy()
+    voltage = df['Voltage (V)'].to_numpy()
+    current = df['Current (A)'].to_numpy()
+    temp = df['Temperature (°C)'].to_numpy()
+    capacity = df['Capacity (Ah)'].to_numpy()
+    types = df['Type'].to_numpy()
+    colors = np.where(types == 'LFP', '#38ef7d', '#764ba2')
+
+    fig = make_subplots(
+        rows=2, cols=2,
+        specs=[[{}, {}], [{'colspan': 2}, None]],
+        subplot_titles=(
+            "🔋 Voltage vs Current Analysis",
+            "🌡️ Temperature Distribution",
+            "✨ Cell Capacity Overview"
+        )
+    )
+
+    # Area normalization as px.scatter does it: the largest marker is
+    # always 20 px regardless of how big capacity gets
+    cap_max = float(capacity.max()) if len(capacity) else 0.0
+    sizeref = 2 * (cap_max or 1.0) / 20 ** 2
+
+    # One scatter trace per cell type, as px's color='Type' produced,
+    # so the green/purple encoding keeps its legend
+    for type_name, color in (('LFP', '#38ef7d'), ('NMC', '#764ba2')):
+        mask = types == type_name
+        if not mask.any():
+            continue
+        fig.add_trace(
+            go.Scattergl(
+                x=voltage[mask],
+                y=current[mask],
+                mode='markers',
+                name=type_name,
+                marker=dict(
+                    color=color,
+                    size=capacity[mask],
+                    sizemode='area',
+                    sizeref=sizeref,
+                    sizemin=4
+                ),
+                customdata=temp[mask],
+                hovertemplate=('%{text}<br>Voltage: %{x}V<br>Current: %{y}A'
+                               '<br>Temperature: %{customdata}°C<extra></extra>'),
+                text=names[mask]
+            ),
+            row=1, col=1
+        )
+
+    fig.add_trace(
+        go.Bar(
+            x=names,
+            y=temp,
+            marker_color=colors,
+            showlegend=False
+        ),
+        row=1, col=2
+    )
+
+    fig.add_trace(
+        go.Bar(
+            name='Current Capacity',
+            x=names,
+            y=capacity,
+            marker_color=colors,
+            showlegend=False
+        ),
+        row=2, col=1
+    )
+
+    fig.update_xaxes(title_text='Voltage (V)', row=1, col=1)
+    fig.update_yaxes(title_text='Current (A)', row=1, col=1)
+    fig.update_xaxes(tickangle=-45, row=1, col=2)
+    fig.update_yaxes(title_text='Temperature (°C)', row=1, col=2)
+    fig.update_xaxes(title_text='Battery Cells', row=2, col=1)
+    fig.update_yaxes(title_text='Capacity (Ah)', row=2, col=1)
+    fig.update_layout(
+        height=700,
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        # Constant uirevision tells plotly.js this is the same chart
+        # across data updates, so it diffs in place and keeps the
+        # user's zoom/pan state instead of doing a full redraw
+        uirevision='constant',
+    )
+    return fig
+
+
+def render_charts():
+    """Render the Step-2 visualizations.
+
+    The figure comes from the cache_resource factory above, keyed on the
+    cells_rev revision counter, so a rerun with unchanged data is just a
+    cache lookup.
+    """
+    st.plotly_chart(
+        make_dashboard_figure(st.session_state.session_token,
+                              st.session_state.cells_rev),
+        use_container_width=True
+    )
+
 
 # Initialize session state
 if 'cells_data' not in st.session_state:
@@ -65,6 +273,33 @@ if 'cell_types' not in st.session_state:
     st.session_state.cell_types = []
 if 'step' not in st.session_state:
     st.session_state.step = 1
+if 'cells' not in st.session_state:
+    # Preallocated structured mirror of cells_data: the cell cap is known,
+    # so aggregates run over a fixed contiguous buffer with no per-add
+    # growth or rehashing. n_cells is the number of valid records.
+    st.session_state.cells = np.zeros(MAX_CELLS, dtype=CELL_DTYPE)
+    st.session_state.n_cells = 0
+if 'preview_html' not in st.session_state:
+    # Step-1 preview cards rendered once per add and accumulated, so the
+    # preview is a single markdown emission instead of O(N) formatting
+    st.session_state.preview_html = ''
+if 'cells_rev' not in st.session_state:
+    # Monotonic revision counter bumped on every cell mutation; caches
+    # key on this int instead of hashing the data itself. Never reset,
+    # so stale cache entries can't be revisited after a Reset.
+    st.session_state.cells_rev = 0
+if 'session_token' not in st.session_state:
+    # cells_rev restarts at 0 in every session, so cache keys carry this
+    # token to stay distinct across sessions
+    st.session_state.session_token = uuid.uuid4().hex
+if 'temp_pool' not in st.session_state:
+    # All temperatures generated up front in one seeded batch: no RNG
+    # call on the add path, and runs are reproducible
+    st.session_state.temp_pool = np.random.default_rng(0).uniform(25, 40, MAX_CELLS).round(1)
+if 'df' not in st.session_state:
+    # Plotting DataFrame, updated incrementally on add/edit so the
+    # pandas constructor never runs inside a rerun
+    st.session_state.df = pd.DataFrame(columns=DF_COLUMNS)
 
 # Header with emojis and colors
 st.markdown('<h1 class="main-header">🔋 Battery Cell Monitor Dashboard 🔋</h1>', unsafe_allow_html=True)
@@ -79,6 +314,11 @@ with st.sidebar:
         st.session_state.cells_data = {}
         st.session_state.cell_types = []
         st.session_state.step = 1
+        st.session_state.pop('cells', None)
+        st.session_state.pop('n_cells', None)
+        st.session_state.pop('df', None)
+        st.session_state.preview_html = ''
+        st.session_state.cells_rev += 1
         st.rerun()
 
     # Step indicator
@@ -91,9 +331,9 @@ with st.sidebar:
     # Quick stats
     if st.session_state.cells_data:
         st.markdown("### 📊 Quick Stats")
-        total_cells = len(st.session_state.cells_data)
-        avg_temp = np.mean([cell['temp'] for cell in st.session_state.cells_data.values()])
-        total_capacity = sum([cell['capacity'] for cell in st.session_state.cells_data.values()])
+        cells = st.session_state.cells[:st.session_state.n_cells]
+        total_cells = st.session_state.n_cells
+        total_capacity, avg_temp, _ = summarize(cells['temp'], cells['capacity'])
 
         st.metric("Total Cells", total_cells, delta=None)
         st.metric("Avg Temperature", f"{avg_temp:.1f}°C")
@@ -118,7 +358,7 @@ if st.session_state.step == 1:
         )
 
         if st.button("➕ Add Cell",
-                     disabled=(selected_type == "Select cell type..." or len(st.session_state.cell_types) >= 8)):
+                     disabled=(selected_type == "Select cell type..." or len(st.session_state.cell_types) >= MAX_CELLS)):
             cell_type = selected_type.lower()
             st.session_state.cell_types.append(cell_type)
 
@@ -127,7 +367,10 @@ if st.session_state.step == 1:
             voltage = 3.2 if cell_type == "lfp" else 3.6
             min_voltage = 2.8 if cell_type == "lfp" else 3.2
             max_voltage = 3.6 if cell_type == "lfp" else 4.0
-            temp = round(random.uniform(25, 40), 1)
+            temp = float(st.session_state.temp_pool[len(st.session_state.cell_types) - 1])
+            # Display name formatted once here instead of re-deriving it
+            # from the key on every rerun
+            display_name = cell_key.replace('_', ' ').title()
 
             st.session_state.cells_data[cell_key] = {
                 "voltage": voltage,
@@ -136,31 +379,53 @@ if st.session_state.step == 1:
                 "capacity": 0.0,
                 "min_voltage": min_voltage,
                 "max_voltage": max_voltage,
-                "type": cell_type
+                "type": cell_type,
+                "display": display_name
+            }
+
+            n = st.session_state.n_cells
+            st.session_state.cells[n] = (
+                voltage, 0.0, temp, 0.0, min_voltage, max_voltage,
+                0 if cell_type == "lfp" else 1
+            )
+            st.session_state.n_cells = n + 1
+
+            df = st.session_state.df
+            df.loc[len(df)] = {
+                'Cell': display_name,
+                'Voltage (V)': voltage,
+                'Current (A)': 0.0,
+                'Temperature (°C)': temp,
+                'Capacity (Ah)': 0.0,
+                'Level %': 0.0,
+                'Type': cell_type.upper()
             }
+
+            card_class = "lfp-card" if cell_type == "lfp" else "nmc-card"
+            emoji = "🟢" if cell_type == "lfp" else "🟣"
+            st.session_state.preview_html += f"""
+            <div class="cell-card {card_class}">
+                <h3>{emoji} Cell #{len(st.session_state.cell_types)}</h3>
+                <p><strong>Type:</strong> {cell_type.upper()}</p>
+                <p><strong>Status:</strong> Ready ✅</p>
+            </div>
+            """
+            st.session_state.cells_rev += 1
             st.rerun()
 
     # Display added cells
     if st.session_state.cell_types:
         st.markdown("### 🎯 Added Cells Preview")
 
-        cols = st.columns(min(4, len(st.session_state.cell_types)))
-        for idx, cell_type in enumerate(st.session_state.cell_types):
-            with cols[idx % 4]:
-                card_class = "lfp-card" if cell_type == "lfp" else "nmc-card"
-                emoji = "🟢" if cell_type == "lfp" else "🟣"
-                st.markdown(f"""
-                <div class="cell-card {card_class}">
-                    <h3>{emoji} Cell #{idx + 1}</h3>
-                    <p><strong>Type:</strong> {cell_type.upper()}</p>
-                    <p><strong>Status:</strong> Ready ✅</p>
-                </div>
-                """, unsafe_allow_html=True)
+        st.markdown(
+            f'<div class="preview-row">{st.session_state.preview_html}</div>',
+            unsafe_allow_html=True
+        )
 
         # Progress bar
-        progress = len(st.session_state.cell_types) / 8
+        progress = len(st.session_state.cell_types) / MAX_CELLS
         st.progress(progress)
-        st.markdown(f"**Progress:** {len(st.session_state.cell_types)}/8 cells added")
+        st.markdown(f"**Progress:** {len(st.session_state.cell_types)}/{MAX_CELLS} cells added")
 
         # Continue button
         if st.button("🚀 Continue to Monitoring Dashboard", type="primary"):
@@ -189,145 +454,44 @@ elif st.session_state.step == 2:
         cell = st.session_state.cells_data[cell_key]
         with cols[idx % 3]:
             emoji = "🟢" if cell['type'] == "lfp" else "🟣"
-            st.markdown(f"#### {emoji} {cell_key.replace('_', ' ').title()}")
+            st.markdown(f"#### {emoji} {cell['display']}")
 
-            # Current input
-            new_current = st.number_input(
+            # Current input; capacity recomputes in the callback only
+            # when this specific input changes
+            st.number_input(
                 "Current (A):",
                 min_value=0.0,
                 max_value=100.0,
                 value=cell['current'],
                 step=0.1,
-                key=f"current_{cell_key}"
+                key=f"current_{cell_key}",
+                on_change=update_capacity,
+                args=(cell_key, idx)
             )
 
-            if new_current != cell['current']:
-                st.session_state.cells_data[cell_key]['current'] = new_current
-                st.session_state.cells_data[cell_key]['capacity'] = round(cell['voltage'] * new_current, 2)
-
-    # Real-time monitoring cards
+    # Real-time monitoring table: one widget (and one payload to the
+    # frontend) instead of 6 widgets per cell
     st.markdown("### 📊 Real-Time Cell Monitoring")
 
-    for cell_key, cell in st.session_state.cells_data.items():
-        col1, col2, col3, col4 = st.columns(4)
-
-        card_color = "#38ef7d" if cell['type'] == "lfp" else "#764ba2"
-
-        with col1:
-            st.metric(
-                label=f"🔋 {cell_key.replace('_', ' ').title()}",
-                value=f"{cell['voltage']}V",
-                delta=None
-            )
-
-        with col2:
-            st.metric(
-                label="⚡ Current",
-                value=f"{cell['current']}A",
-                delta=None
-            )
-
-        with col3:
-            st.metric(
-                label="🌡️ Temperature",
-                value=f"{cell['temp']}°C",
-                delta=None
-            )
-
-        with col4:
-            st.metric(
-                label="✨ Capacity",
-                value=f"{cell['capacity']} Ah",
-                delta=None
-            )
-
-        # Battery level indicator
-        battery_level = min(100, (cell['capacity'] / 10) * 100) if cell['capacity'] > 0 else 0
-        st.progress(battery_level / 100)
-
-        st.markdown("---")
+    st.dataframe(
+        st.session_state.df.style.bar(
+            subset=['Level %'], color='#38ef7d', vmin=0, vmax=100
+        ),
+        use_container_width=True,
+        hide_index=True
+    )
 
     # Visualizations
     st.markdown("### 📈 Data Visualizations")
 
     if st.session_state.cells_data:
-        # Create dataframe for plotting
-        df_data = []
-        for cell_key, cell in st.session_state.cells_data.items():
-            df_data.append({
-                'Cell': cell_key.replace('_', ' ').title(),
-                'Voltage (V)': cell['voltage'],
-                'Current (A)': cell['current'],
-                'Temperature (°C)': cell['temp'],
-                'Capacity (Ah)': cell['capacity'],
-                'Type': cell['type'].upper()
-            })
-
-        df = pd.DataFrame(df_data)
-
         # Create visualizations
-        col1, col2 = st.columns(2)
-
-        with col1:
-            # Voltage vs Current scatter plot
-            fig1 = px.scatter(
-                df,
-                x='Voltage (V)',
-                y='Current (A)',
-                color='Type',
-                size='Capacity (Ah)',
-                hover_data=['Temperature (°C)'],
-                title="🔋 Voltage vs Current Analysis",
-                color_discrete_map={'LFP': '#38ef7d', 'NMC': '#764ba2'}
-            )
-            fig1.update_layout(
-                plot_bgcolor='rgba(0,0,0,0)',
-                paper_bgcolor='rgba(0,0,0,0)',
-            )
-            st.plotly_chart(fig1, use_container_width=True)
-
-        with col2:
-            # Temperature distribution
-            fig2 = px.bar(
-                df,
-                x='Cell',
-                y='Temperature (°C)',
-                color='Type',
-                title="🌡️ Temperature Distribution",
-                color_discrete_map={'LFP': '#38ef7d', 'NMC': '#764ba2'}
-            )
-            fig2.update_layout(
-                plot_bgcolor='rgba(0,0,0,0)',
-                paper_bgcolor='rgba(0,0,0,0)',
-                xaxis_tickangle=-45
-            )
-            st.plotly_chart(fig2, use_container_width=True)
-
-        # Capacity overview
-        fig3 = go.Figure(data=[
-            go.Bar(
-                name='Current Capacity',
-                x=df['Cell'],
-                y=df['Capacity (Ah)'],
-                marker_color=['#38ef7d' if t == 'LFP' else '#764ba2' for t in df['Type']]
-            )
-        ])
-
-        fig3.update_layout(
-            title="✨ Cell Capacity Overview",
-            xaxis_title="Battery Cells",
-            yaxis_title="Capacity (Ah)",
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            showlegend=False
-        )
-
-        st.plotly_chart(fig3, use_container_width=True)
+        render_charts()
 
         # Data table
         st.markdown("### 📋 Detailed Cell Data")
         st.dataframe(
-            df,
+            st.session_state.df,
             use_container_width=True,
             hide_index=True
         )